@@ -5,19 +5,83 @@ No cleanup, just reliable frame saving
 """
 
 import cv2
+import numpy as np
 import os
+import errno
 import sys
 import time
 import signal
 import threading
+import queue
+import collections
+import mmap
+import struct
 import logging
 from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlparse, parse_qs
 from socketserver import ThreadingMixIn
 from datetime import datetime
 import json
-from pathlib import Path
 import argparse
 import platform
+import ctypes
+
+# Optional: io_uring batched writes (Linux only)
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+# Optional: NVJPEG GPU JPEG encoding (Jetson / CUDA hosts)
+try:
+    from nvjpeg import NvJpeg
+except ImportError:
+    NvJpeg = None
+
+# Optional: libjpeg-turbo JPEG encoding
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+# Optional: Numba-compiled 2x downscale for the /stream preview
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+if njit is not None:
+    # Serial on purpose: a parallel kernel would start a Numba worker pool
+    # that ignores pin_threads, and its workqueue layer aborts the process
+    # when HTTP threads call the kernel concurrently. nogil already lets
+    # callers run it alongside capture.
+    @njit(cache=True, nogil=True)
+    def downscale_2x(src, dst):
+        """Average each 2x2 block of src into one pixel of dst (same result as INTER_AREA)"""
+        for y in range(dst.shape[0]):
+            for x in range(dst.shape[1]):
+                for c in range(dst.shape[2]):
+                    dst[y, x, c] = (np.uint16(src[2 * y, 2 * x, c]) + src[2 * y, 2 * x + 1, c]
+                                    + src[2 * y + 1, 2 * x, c] + src[2 * y + 1, 2 * x + 1, c] + 2) >> 2
+else:
+    downscale_2x = None
+
+# macOS thread QoS classes from <sys/qos.h>
+QOS_CLASS_USER_INTERACTIVE = 0x21
+QOS_CLASS_UTILITY = 0x11
+
+# O_DIRECT needs buffers, offsets and lengths aligned to the logical block size
+DIRECT_IO_ALIGN = 4096
+
+# Frame ring file header: magic, slot count, slot size. Slots start at
+# RING_DATA_OFFSET so they stay page-aligned
+RING_FILE_MAGIC = b'OACF'
+RING_FILE_HEADER = struct.Struct('<4sII')
+RING_DATA_OFFSET = 4096
+
+# Frame ring file slot header: magic, frame counter, save time, payload length
+RING_MAGIC = b'OACR'
+RING_HEADER = struct.Struct('<4sQdI')
 
 # Setup logging
 logging.basicConfig(
@@ -32,10 +96,71 @@ class CameraStreamer:
     def __init__(self, config):
         self.config = config
         self.camera = None
-        self.frame = None
+        # Guards only the published slot index and frame id; camera reads,
+        # copies and encodes (which release the GIL) must stay outside it
         self.frame_lock = threading.Lock()
+        # Notified on every published frame so stream clients wake once per frame
+        self._frame_cond = threading.Condition(self.frame_lock)
+
+        # Double-buffered frame slots: capture fills slots[pub_idx ^ 1] and
+        # then flips pub_idx, readers only ever touch slots[pub_idx]
+        self.slots = None
+        self.pub_idx = 0
+
+        # Bumped on every published frame; lets HTTP clients share one
+        # JPEG encode per frame via {(width, quality): (frame_id, jpeg bytes)}
+        self._frame_id = 0
+        self._jpeg_cache = {}
+        # One encode in flight per cache key; other clients wait for its result
+        self._encode_locks = {}
+
+        self._hw_encode = self._select_hw_encoder()
+        self._tj = None
+        if self._hw_encode is None and TurboJPEG is not None:
+            try:
+                self._tj = TurboJPEG()
+                logger.info("✓ Using libjpeg-turbo for JPEG encoding")
+            except (OSError, RuntimeError) as e:
+                logger.warning(f"libjpeg-turbo unavailable, using OpenCV JPEG encoding: {e}")
         self.running = False
         self.frame_counter = 0
+        self.frames_dropped = 0
+
+        # We are the only writer to frame_dir, so count files instead of
+        # rescanning the directory; seeded once in _scan_frame_dir()
+        self.files_written = 0
+        self._first_counter = 1
+
+        # Frames waiting to be written to disk by the writer thread
+        self.write_q = queue.Queue(maxsize=config.get('write_queue_size', 16))
+        self.writer_thread = None
+        self.write_batch_size = max(1, config.get('write_batch_size', 8))
+        self.write_batch_spins = config.get('write_batch_spins', 3)
+        # Smoothed queue depth seen by the writer; sets the target batch size
+        self._ewma_qlen = 1.0
+        self._batch_sizes = collections.Counter()
+        self._ring = None
+        self._cqe = None
+        self._direct_buf = None
+
+        # Fixed-size mmap ring file used instead of img_* files when
+        # storage is 'ring'
+        self._frame_ring = None
+        self._frame_ring_path = None
+        self._frame_ring_lock = threading.Lock()
+        self._ring_slots = 0
+        self._ring_slot_size = 0
+
+        # CPU sets for the capture / writer / HTTP threads when pin_threads is on
+        self._cpu_sets = self._plan_cpu_sets()
+
+        # /status JSON after the volatile counters; built on first request
+        self._status_tail = None
+
+        # Frame paths are built as bytes from a fixed prefix/suffix
+        ext = 'webp' if config.get('format', 'webp').lower() == 'webp' else 'jpg'
+        self._path_prefix = os.path.join(os.fsencode(config['frame_dir']), b'img_')
+        self._path_suffix = b'.' + ext.encode()
 
         # Create output directory
         os.makedirs(config['frame_dir'], exist_ok=True)
@@ -43,6 +168,9 @@ class CameraStreamer:
 
     def start_camera(self):
         """Initialize camera with multiple backend attempts"""
+        self._scan_frame_dir()
+        self._warm_up_kernels()
+
         camera_index = self.config['camera_index']
 
         # Check if it's a video file
@@ -52,6 +180,7 @@ class CameraStreamer:
             self.is_video_file = True
 
             if self.camera.isOpened():
+                self.start_writer()
                 return True
             else:
                 logger.error(f"Failed to open video file: {camera_index}")
@@ -84,6 +213,7 @@ class CameraStreamer:
                 if self.camera.isOpened():
                     logger.info(f"✓ Camera opened at index {idx}")
                     self.config['camera_index'] = idx  # Update config
+                    self._status_tail = None
                     return self._configure_camera()
 
         else:
@@ -95,11 +225,109 @@ class CameraStreamer:
         logger.error(f"Failed to open camera after all attempts")
         return False
 
+    def _plan_cpu_sets(self):
+        """Split the usable CPUs between capture, writer and HTTP threads"""
+        if not self.config.get('pin_threads', False) or not hasattr(os, 'sched_getaffinity'):
+            return {}
+
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < 2:
+            logger.warning("pin_threads needs at least 2 CPUs, not pinning")
+            return {}
+
+        # Capture gets a core to itself; writer and HTTP share the rest
+        # unless there are enough cores to split them too
+        rest = cpus[1:] if len(cpus) < 3 else cpus[2:]
+        cpu_sets = {
+            'capture': {cpus[0]},
+            'writer': {cpus[1]},
+            'http': set(rest),
+        }
+        logger.info(f"Thread CPU sets: {cpu_sets}")
+        return cpu_sets
+
+    def tune_thread(self, role):
+        """Best-effort CPU pinning and scheduling for the calling thread"""
+        if platform.system() == "Darwin":
+            # No affinity API on macOS; QoS steers threads to P/E cores instead
+            qos = {'capture': QOS_CLASS_USER_INTERACTIVE, 'writer': QOS_CLASS_UTILITY}.get(role)
+            if qos is not None:
+                try:
+                    ctypes.CDLL(None).pthread_set_qos_class_self_np(qos, 0)
+                except (OSError, AttributeError) as e:
+                    logger.warning(f"Could not set {role} thread QoS: {e}")
+            return
+
+        cpus = self._cpu_sets.get(role)
+        if cpus:
+            try:
+                os.sched_setaffinity(0, cpus)
+            except OSError as e:
+                logger.warning(f"Could not pin {role} thread to CPUs {cpus}: {e}")
+
+        priority = self.config.get('capture_priority', 0)
+        if role == 'capture' and priority and hasattr(os, 'sched_setscheduler'):
+            try:
+                os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(priority))
+                logger.info(f"✓ Capture thread running SCHED_FIFO priority {priority}")
+            except OSError as e:
+                logger.warning(f"Could not raise capture thread priority: {e}")
+
+    def _warm_up_kernels(self):
+        """Compile Numba kernels now rather than on the first /stream request"""
+        if downscale_2x is None:
+            return
+
+        start = time.time()
+        downscale_2x(np.zeros((2, 2, 3), np.uint8), np.empty((1, 1, 3), np.uint8))
+        logger.info(f"✓ Numba downscale kernel ready ({time.time() - start:.1f}s)")
+
+    def _scan_frame_dir(self):
+        """Seed file and frame counters from frames left by a previous run"""
+        if self.config.get('storage', 'files') == 'ring':
+            # The ring file keeps its own counters, see _init_frame_ring
+            return
+
+        prefix = 'img_'
+        suffix = os.fsdecode(self._path_suffix)
+        count = 0
+        last = 0
+        with os.scandir(self.config['frame_dir']) as entries:
+            for entry in entries:
+                name = entry.name
+                if name.startswith(prefix) and name.endswith(suffix):
+                    number = name[len(prefix):-len(suffix)]
+                    if number.isdecimal():
+                        count += 1
+                        last = max(last, int(number))
+
+        self.files_written = count
+        self.frame_counter = last
+        self._first_counter = last + 1
+        if count:
+            logger.info(f"Found {count} existing frames, continuing from frame {last + 1}")
+
+    def start_writer(self):
+        """Start the background disk writer thread"""
+        if self.writer_thread is None:
+            self._init_frame_ring()
+            if self._frame_ring is None:
+                self._init_direct_io()
+                self._init_uring()
+            self.writer_thread = threading.Thread(target=self._writer_loop)
+            self.writer_thread.daemon = True
+            self.writer_thread.start()
+
     def _configure_camera(self):
         """Configure camera properties"""
         if not self.is_video_file:
             # Try to set properties (may not work on all cameras)
             try:
+                # Ask for the camera's native MJPG stream before sizing, so
+                # UVC devices don't fall back to uncompressed YUYV
+                fourcc = self.config.get('fourcc', 'MJPG')
+                if fourcc:
+                    self.camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
                 self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.config['width'])
                 self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.config['height'])
                 self.camera.set(cv2.CAP_PROP_FPS, self.config['fps'])
@@ -110,13 +338,22 @@ class CameraStreamer:
         actual_width = int(self.camera.get(cv2.CAP_PROP_FRAME_WIDTH))
         actual_height = int(self.camera.get(cv2.CAP_PROP_FRAME_HEIGHT))
         actual_fps = int(self.camera.get(cv2.CAP_PROP_FPS)) or self.config['fps']
+        actual_fourcc = int(self.camera.get(cv2.CAP_PROP_FOURCC))
+        if actual_fourcc > 0:
+            fourcc_name = actual_fourcc.to_bytes(4, 'little').decode('ascii', 'replace')
+        else:
+            fourcc_name = 'unknown format'
 
-        logger.info(f"✓ Camera initialized: {actual_width}x{actual_height}@{actual_fps}fps")
+        logger.info(f"✓ Camera initialized: {actual_width}x{actual_height}@{actual_fps}fps ({fourcc_name})")
+        self.start_writer()
 
         # Test capture
         ret, test_frame = self.camera.read()
         if ret:
             logger.info("✓ Test frame captured successfully")
+            # Preallocate both frame slots so camera.read() decodes into
+            # them from the very first frame
+            self.slots = [test_frame, np.empty_like(test_frame)]
             return True
         else:
             logger.warning("Could not capture test frame, but will continue")
@@ -125,14 +362,29 @@ class CameraStreamer:
     def capture_loop(self):
         """Main capture loop - reads frames and saves to disk"""
         self.running = True
+        self.tune_thread('capture')
         frame_interval = 1.0 / self.config['frame_fps']
-        last_frame_time = 0
+        next_save_time = 0
 
         logger.info(f"Capture loop started. Frame interval: {frame_interval}s (FPS: {self.config['frame_fps']})")
         logger.info("CLEANUP DISABLED - frames will accumulate")
 
+        # Hoist attribute lookups out of the per-frame path
+        read = self.camera.read
+        frame_cond = self._frame_cond
+        put_frame = self.write_q.put_nowait
+        monotonic = time.monotonic
+        slots = self.slots
+        # Cameras block in read() until the next frame; video files don't,
+        # so give them a small delay to prevent CPU overload
+        idle_delay = 0.001 if self.is_video_file else 0
+
         while self.running:
-            ret, frame = self.camera.read()
+            if slots is None:
+                ret, frame = read()
+            else:
+                back_idx = self.pub_idx ^ 1
+                ret, frame = read(slots[back_idx])
             if not ret:
                 if self.is_video_file:
                     # Loop video file
@@ -144,108 +396,565 @@ class CameraStreamer:
                     time.sleep(0.1)
                     continue
 
-            # Update current frame for HTTP streaming
-            with self.frame_lock:
-                self.frame = frame.copy()
+            # Publish frame for HTTP streaming
+            if slots is None:
+                # No test frame to size the slots from (video file): use
+                # the first frame
+                slots = [frame, np.empty_like(frame)]
+                back_idx = 0
+                self.slots = slots
+            elif frame is not slots[back_idx]:
+                # Frame size changed, OpenCV allocated a new array
+                slots[back_idx] = frame
+            with frame_cond:
+                self.pub_idx = back_idx
+                self._frame_id += 1
+                frame_cond.notify_all()
+
+            # Queue frame for the writer thread at specified FPS; never block
+            # the capture path on disk I/O
+            now = monotonic()
+            if now >= next_save_time:
+                next_save_time = now + frame_interval
+                self.frame_counter += 1
+                try:
+                    # Slots are recycled, so the writer gets its own copy
+                    put_frame((self.frame_counter, self._frame_id, frame.copy()))
+                except queue.Full:
+                    self.frames_dropped += 1
+                    if self.frames_dropped == 1 or self.frames_dropped % 50 == 0:
+                        logger.warning(f"Writer queue full, dropped {self.frames_dropped} frames so far")
+
+            if idle_delay:
+                time.sleep(idle_delay)
+
+    def _select_hw_encoder(self):
+        """Pick a hardware JPEG encoder, None to encode on the CPU"""
+        if not self.config.get('hw_encode', True):
+            return None
+
+        if NvJpeg is not None:
+            try:
+                encoder = NvJpeg()
+                logger.info("✓ Using NVJPEG hardware JPEG encoding")
+                return encoder.encode
+            except Exception as e:
+                logger.warning(f"NVJPEG unavailable: {e}")
 
-            # Save frame to disk at specified FPS
-            current_time = time.time()
-            if current_time - last_frame_time >= frame_interval:
-                self.save_frame(frame)
-                last_frame_time = current_time
+        return None
 
-            # Small delay to prevent CPU overload
-            time.sleep(0.001)
+    def encode_jpeg(self, frame, quality):
+        """Encode a BGR frame as JPEG bytes, None on failure"""
+        if self._hw_encode is not None:
+            return self._hw_encode(frame, quality)
 
-    def get_file_pattern(self):
-        """Get file glob pattern based on configured format"""
-        format_type = self.config.get('format', 'webp').lower()
-        return f"img_*.{format_type}"
+        if self._tj is not None:
+            return self._tj.encode(frame, quality=quality, pixel_format=TJPF_BGR,
+                                   jpeg_subsample=TJSAMP_420)
 
-    def save_frame(self, frame):
-        """Save frame to disk in configurable format (JPG/WebP)"""
-        self.frame_counter += 1
+        ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if ret:
+            return jpeg.tobytes()
+        return None
 
+    def _init_frame_ring(self):
+        """Open or create the frame ring file, if ring storage is enabled"""
+        if self.config.get('storage', 'files') != 'ring':
+            return
+
+        slots = self.config.get('ring_slots', 600)
+        slot_size = self.config.get('ring_slot_kb', 512) << 10
+        path = self.config.get('ring_path') or os.path.join(self.config['frame_dir'], 'frames.ring')
+
+        size = RING_DATA_OFFSET + slots * slot_size
+        header = RING_FILE_HEADER.pack(RING_FILE_MAGIC, slots, slot_size)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # Frames from a ring with another geometry would be read at the
+            # wrong offsets, so start over when the layout doesn't match
+            existing = os.fstat(fd).st_size
+            if existing != size or os.pread(fd, len(header), 0) != header:
+                if existing:
+                    logger.warning(f"Ring file {path} has a different layout, discarding its frames")
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, header, 0)
+            self._frame_ring = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._frame_ring_path = path
+        self._ring_slots = slots
+        self._ring_slot_size = slot_size
+
+        # Continue numbering after the newest frame left in the ring
+        last = 0
+        occupied = 0
+        capacity = slot_size - RING_HEADER.size
+        for slot in range(slots):
+            offset = RING_DATA_OFFSET + slot * slot_size
+            magic, counter, _, length = RING_HEADER.unpack_from(self._frame_ring, offset)
+            if magic == RING_MAGIC and length <= capacity:
+                last = max(last, counter)
+                occupied += 1
+        # With ring storage, files_written counts occupied slots
+        self.files_written = occupied
+        if last > self.frame_counter:
+            self.frame_counter = last
+            self._first_counter = last + 1
+
+        logger.info(f"✓ Saving frames to ring file {path} ({slots} slots of {slot_size >> 10} KB)")
+
+    def _init_direct_io(self):
+        """Set up a page-aligned buffer for O_DIRECT writes, if enabled"""
+        if not self.config.get('direct_io', False):
+            return
+
+        if not hasattr(os, 'O_DIRECT'):
+            logger.warning("direct_io requested but O_DIRECT is not supported on this platform")
+            return
+
+        # Anonymous mmap is page-aligned, which satisfies O_DIRECT
+        size = self.config.get('direct_io_buffer_mb', 4) << 20
+        self._direct_buf = mmap.mmap(-1, size)
+        logger.info(f"✓ Using O_DIRECT writes ({size >> 20} MB aligned buffer)")
+
+    def _init_uring(self):
+        """Set up an io_uring for batched writes, if available"""
+        if liburing is None or not self.config.get('io_uring', True):
+            logger.info("Using threaded file writes")
+            return
+
+        try:
+            ring = liburing.Ring()
+            liburing.io_uring_queue_init(self.write_batch_size, ring)
+            self._ring = ring
+            self._cqe = liburing.Cqe()
+            logger.info(f"✓ Using io_uring batched writes (batch size {self.write_batch_size})")
+        except Exception as e:
+            logger.warning(f"io_uring unavailable, using threaded file writes: {e}")
+            self._ring = None
+
+    def _writer_loop(self):
+        """Drain the write queue and save frames to disk in batches"""
+        self.tune_thread('writer')
+        while True:
+            # Block for the first frame, then size the batch from the recent
+            # queue depth: shallow queue -> write right away, deep queue ->
+            # wait briefly so more frames share one submission
+            batch = [self.write_q.get()]
+            self._ewma_qlen += 0.2 * (self.write_q.qsize() + 1 - self._ewma_qlen)
+            target = min(max(round(self._ewma_qlen), 1), self.write_batch_size)
+
+            spins = 0
+            while len(batch) < target:
+                try:
+                    batch.append(self.write_q.get_nowait())
+                except queue.Empty:
+                    if spins >= self.write_batch_spins:
+                        break
+                    spins += 1
+                    time.sleep(0.001)
+
+            self._batch_sizes[len(batch)] += 1
+            if sum(self._batch_sizes.values()) >= 100:
+                logger.debug(f"Writer batch sizes (last 100 batches): {dict(sorted(self._batch_sizes.items()))}")
+                self._batch_sizes.clear()
+
+            try:
+                self.save_frames(batch)
+            except Exception as e:
+                logger.error(f"✗ Failed to save frames {batch[0][0]}-{batch[-1][0]}: {e}")
+            finally:
+                for _ in batch:
+                    self.write_q.task_done()
+
+    def save_frames(self, batch):
+        """Encode a batch of frames and save them in configurable format (JPG/WebP)"""
         # Get format from config (webp or jpg)
         format_type = self.config.get('format', 'webp').lower()
 
+        quality = self.config.get('quality', 95)
+
         if format_type == 'webp':
-            filename = f"img_{self.frame_counter:06d}.webp"
-            codec_setting = [cv2.IMWRITE_WEBP_QUALITY, self.config.get('quality', 95)]
+            ext = '.webp'
+            codec_setting = [cv2.IMWRITE_WEBP_QUALITY, quality]
         else:  # Default to JPG for compatibility
-            filename = f"img_{self.frame_counter:06d}.jpg"
-            codec_setting = [cv2.IMWRITE_JPEG_QUALITY, self.config.get('quality', 95)]
+            ext = '.jpg'
 
-        filepath = os.path.join(self.config['frame_dir'], filename)
-
-        # Save frame with selected format and quality
-        success = cv2.imwrite(filepath, frame, codec_setting)
-
-        if success:
-            if self.frame_counter == 1:
-                logger.info(f"✓ First frame saved: {filepath}")
-            elif self.frame_counter % 50 == 0:
-                # Check actual files in directory
-                files = list(Path(self.config['frame_dir']).glob(self.get_file_pattern()))
-                logger.info(f"✓ Frame {self.frame_counter} saved. Total files on disk: {len(files)}")
+        encoded = []
+        for counter, frame_id, frame in batch:
+            if ext == '.jpg':
+                data = self.encode_jpeg(frame, quality)
+            else:
+                success, buf = cv2.imencode(ext, frame, codec_setting)
+                data = buf.tobytes() if success else None
+
+            if data is not None:
+                filepath = self._path_prefix + b'%06d' % counter + self._path_suffix
+                encoded.append((counter, filepath, data))
+                key = (None, quality)
+                if ext == '.jpg' and frame_id > self._jpeg_cache.get(key, (-1, None))[0]:
+                    # Let full-resolution HTTP clients at the same quality reuse this encode
+                    self._jpeg_cache[key] = (frame_id, data)
+            else:
+                logger.error(f"✗ Failed to encode frame {counter}")
+
+        if self._frame_ring is not None:
+            written = self._write_frame_ring(encoded)
+        elif self._direct_buf is not None:
+            written = self._write_direct(encoded)
+        elif self._ring is not None:
+            written = self._write_uring(encoded)
         else:
-            logger.error(f"✗ Failed to save frame {self.frame_counter}")
-
-    def get_jpeg_frame(self):
-        """Get current frame as JPEG for HTTP streaming"""
-        with self.frame_lock:
-            if self.frame is None:
+            written = self._write_files(encoded)
+
+        for counter, filepath in written:
+            if self._frame_ring is None:
+                self.files_written += 1
+            if counter == self._first_counter:
+                logger.info(f"✓ First frame saved: {os.fsdecode(filepath)}")
+            elif counter % 50 == 0:
+                logger.info(f"✓ Frame {counter} saved. Total files on disk: {self.files_written}")
+
+    def _write_files(self, encoded):
+        """Write encoded frames one file at a time"""
+        written = []
+        for counter, filepath, buf in encoded:
+            try:
+                fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    view = memoryview(buf)
+                    while view:
+                        view = view[os.write(fd, view):]
+                finally:
+                    os.close(fd)
+                written.append((counter, filepath))
+            except OSError as e:
+                logger.error(f"✗ Failed to save frame {counter}: {e}")
+        return written
+
+    def _write_frame_ring(self, encoded):
+        """Write encoded frames into their slots of the ring file"""
+        written = []
+        saved_at = time.time()
+        capacity = self._ring_slot_size - RING_HEADER.size
+        for counter, filepath, buf in encoded:
+            if len(buf) > capacity:
+                logger.error(f"✗ Frame {counter} is {len(buf)} bytes, ring slots hold {capacity}")
+                continue
+
+            offset = RING_DATA_OFFSET + (counter % self._ring_slots) * self._ring_slot_size
+            start = offset + RING_HEADER.size
+            with self._frame_ring_lock:
+                magic, _, _, length = RING_HEADER.unpack_from(self._frame_ring, offset)
+                if magic != RING_MAGIC or length > capacity:
+                    self.files_written += 1
+                self._frame_ring[start:start + len(buf)] = buf
+                RING_HEADER.pack_into(self._frame_ring, offset, RING_MAGIC, counter, saved_at, len(buf))
+            written.append((counter, self._frame_ring_path))
+        return written
+
+    def read_saved_frame(self, counter):
+        """Return a saved frame's encoded bytes if it is still in the ring, else None"""
+        if self._frame_ring is None:
+            return None
+
+        offset = RING_DATA_OFFSET + (counter % self._ring_slots) * self._ring_slot_size
+        start = offset + RING_HEADER.size
+        with self._frame_ring_lock:
+            magic, stored, _, length = RING_HEADER.unpack_from(self._frame_ring, offset)
+            if magic != RING_MAGIC or stored != counter:
                 return None
-            # Encode frame as JPEG
-            ret, jpeg = cv2.imencode('.jpg', self.frame,
-                                     [cv2.IMWRITE_JPEG_QUALITY, 90])
-            if ret:
-                return jpeg.tobytes()
+            if length > self._ring_slot_size - RING_HEADER.size:
+                logger.warning(f"Ring slot for frame {counter} is corrupt ({length} bytes)")
+                return None
+            return self._frame_ring[start:start + length]
+
+    def _write_direct(self, encoded):
+        """Write encoded frames with O_DIRECT, bypassing the page cache"""
+        written = []
+        fallback = []
+        buf_view = memoryview(self._direct_buf)
+        for i, (counter, filepath, buf) in enumerate(encoded):
+            length = len(buf)
+            padded = (length + DIRECT_IO_ALIGN - 1) & ~(DIRECT_IO_ALIGN - 1)
+            if padded > len(buf_view):
+                fallback.append((counter, filepath, buf))
+                continue
+
+            # Write the block-padded copy, then trim the file to the real size
+            buf_view[:length] = buf
+            try:
+                fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_DIRECT, 0o644)
+                try:
+                    os.pwrite(fd, buf_view[:padded], 0)
+                    os.ftruncate(fd, length)
+                finally:
+                    os.close(fd)
+                written.append((counter, filepath))
+            except OSError as e:
+                if e.errno != errno.EINVAL:
+                    logger.error(f"✗ Failed to save frame {counter}: {e}")
+                    continue
+                # Filesystem doesn't support O_DIRECT (e.g. tmpfs)
+                logger.warning(f"O_DIRECT not supported for {self.config['frame_dir']}, using buffered writes")
+                buf_view.release()
+                self._direct_buf.close()
+                self._direct_buf = None
+                fallback.extend(encoded[i:])
+                break
+
+        if fallback:
+            written.extend(self._write_files(fallback))
+        return written
+
+    def _write_uring(self, encoded):
+        """Write encoded frames with a single io_uring submission"""
+        written = []
+        pending = []
+        for counter, filepath, buf in encoded:
+            try:
+                fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                pending.append((counter, filepath, buf, fd))
+            except OSError as e:
+                logger.error(f"✗ Failed to save frame {counter}: {e}")
+
+        # Every prepared write is submitted and reaped before the fds are
+        # closed, since the kernel may use an fd until its CQE is posted
+        results = {}
+        prepared = 0
+        try:
+            for i, (counter, filepath, buf, fd) in enumerate(pending):
+                sqe = liburing.io_uring_get_sqe(self._ring)
+                if sqe is None:
+                    break
+                liburing.io_uring_prep_write(sqe, fd, buf, 0)
+                sqe.user_data = i
+                prepared += 1
+            if prepared:
+                liburing.io_uring_submit(self._ring)
+
+            while len(results) < prepared:
+                try:
+                    liburing.io_uring_wait_cqe(self._ring, self._cqe)
+                except InterruptedError:
+                    continue
+                cqe = self._cqe[0]
+                results[cqe.user_data] = cqe.res
+                liburing.io_uring_cqe_seen(self._ring, cqe)
+        except Exception as e:
+            # Unsubmitted SQEs or unreaped CQEs would leak into the next
+            # batch, so drop the ring rather than guess at its state
+            logger.warning(f"io_uring failed, using threaded file writes: {e}")
+            liburing.io_uring_queue_exit(self._ring)
+            self._ring = None
+        finally:
+            for counter, filepath, buf, fd in pending:
+                os.close(fd)
+
+        # Frames without a completion are rewritten from scratch
+        retry = []
+        for i, (counter, filepath, buf, fd) in enumerate(pending):
+            res = results.get(i)
+            if res is None:
+                retry.append((counter, filepath, buf))
+            elif res == len(buf):
+                written.append((counter, filepath))
+            elif res >= 0:
+                # Short write: finish it synchronously
+                with open(filepath, 'r+b') as f:
+                    f.seek(res)
+                    f.write(buf[res:])
+                written.append((counter, filepath))
+            else:
+                logger.error(f"✗ Failed to save frame {counter}: {os.strerror(-res)}")
+        if retry:
+            written.extend(self._write_files(retry))
+        return written
+
+    def wait_for_frame(self, last_id, timeout=1.0):
+        """Wait until a frame newer than last_id is published, return the current frame id"""
+        with self._frame_cond:
+            self._frame_cond.wait_for(lambda: self._frame_id != last_id, timeout)
+            return self._frame_id
+
+    def get_jpeg_frame(self, width=None, quality=90):
+        """Get current frame as JPEG for HTTP streaming, optionally downscaled to width"""
+        # Readers don't hold frame_lock while encoding, and the slot they
+        # read becomes capture's back buffer after the next publish. Treat
+        # frame_id as a sequence number: if it moved while we worked, the
+        # slot may have been overwritten, so retry on a private copy.
+        for attempt in range(3):
+            with self.frame_lock:
+                if self._frame_id == 0:
+                    return None
+                frame = self.slots[self.pub_idx]
+                frame_id = self._frame_id
+
+            if width is not None and width >= frame.shape[1]:
+                width = None
+            key = (width, quality)
+
+            # Reuse the last encode if no new frame has been published
+            cached_id, cached_jpeg = self._jpeg_cache.get(key, (-1, None))
+            if cached_id == frame_id:
+                return cached_jpeg
+
+            with self._encode_locks.setdefault(key, threading.Lock()):
+                # Another client may have encoded this frame while we waited
+                cached_id, cached_jpeg = self._jpeg_cache.get(key, (-1, None))
+                if cached_id >= frame_id:
+                    return cached_jpeg
+
+                if attempt:
+                    # A memcpy is far shorter than an encode, so this rarely races
+                    frame = frame.copy()
+                    if self._frame_id != frame_id:
+                        continue
+
+                data = self._encode_preview(frame, width, quality)
+                if not attempt and self._frame_id != frame_id:
+                    continue
+
+                if data is not None and frame_id > self._jpeg_cache.get(key, (-1, None))[0]:
+                    self._jpeg_cache[key] = (frame_id, data)
+                return data
+
+        logger.debug("Frames published faster than they can be copied, skipping")
         return None
 
-    def stop(self):
-        """Stop capture and cleanup"""
+    def _encode_preview(self, frame, width, quality):
+        """Scale frame to width (None for full size) and encode it as JPEG"""
+        if width is not None:
+            src_height, src_width = frame.shape[:2]
+            if downscale_2x is not None and width == src_width // 2 and frame.ndim == 3:
+                small = np.empty((src_height // 2, width, frame.shape[2]), np.uint8)
+                downscale_2x(frame, small)
+                frame = small
+            else:
+                height = max(1, round(src_height * width / src_width))
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+
+        return self.encode_jpeg(frame, quality)
+
+    def status_json(self):
+        """Service status as JSON bytes, same layout as json.dumps(status, indent=2)"""
+        # Only the counters change between requests; the config part is
+        # serialized once and spliced in after them
+        if self._status_tail is None:
+            static = json.dumps({
+                'frame_dir': self.config['frame_dir'],
+                'config': self.config
+            }, indent=2).encode()
+            self._status_tail = static[1:]
+
+        return b'{\n  "running": %s,\n  "frame_count": %d,\n  "files_on_disk": %d,%s' % (
+            b'true' if self.running else b'false',
+            self.frame_counter,
+            self.files_written,
+            self._status_tail)
+
+    def stop(self, drain_timeout=10.0):
+        """Stop capture, flush queued frames to disk and cleanup"""
         self.running = False
         if self.camera:
             self.camera.release()
         logger.info("Camera capture stopped")
 
+        # The writer is a daemon thread, so wait for it to finish the frames
+        # still queued before the process exits
+        if self.writer_thread is not None:
+            deadline = time.monotonic() + drain_timeout
+            with self.write_q.all_tasks_done:
+                while self.write_q.unfinished_tasks:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        logger.warning(f"{self.write_q.unfinished_tasks} queued frames not written")
+                        break
+                    self.write_q.all_tasks_done.wait(remaining)
+
         # Final report
-        files = list(Path(self.config['frame_dir']).glob(self.get_file_pattern()))
-        logger.info(f"Final: {self.frame_counter} frames captured, {len(files)} files on disk")
+        logger.info(f"Final: {self.frame_counter} frames captured, {self.files_written} files on disk")
 
 
 class StreamingHandler(BaseHTTPRequestHandler):
     """HTTP request handler for MJPEG streaming"""
 
+    # Socket timeout in seconds, so an idle or stalled client can't hold a
+    # pool worker (or a stream slot) forever
+    timeout = 10
+
     def do_GET(self):
-        if self.path == '/stream':
+        url = urlparse(self.path)
+        if url.path == '/stream':
             self.send_mjpeg_stream()
-        elif self.path == '/frame':
-            self.send_single_frame()
-        elif self.path == '/status':
+        elif url.path == '/frame':
+            query = parse_qs(url.query)
+            if 'n' in query:
+                self.send_saved_frame(query['n'][0])
+            else:
+                self.send_single_frame()
+        elif url.path == '/status':
             self.send_status()
         else:
             self.send_error(404)
 
     def send_mjpeg_stream(self):
-        """Send MJPEG stream"""
-        self.send_response(200)
-        self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=--frame')
-        self.end_headers()
-
+        """Send MJPEG stream from a dedicated thread, freeing this worker"""
+        if not self.server.detach_stream(self.request):
+            self.send_error(503, "Too many streams")
+            return
+        try:
+            self.send_response(200)
+            self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+            self.end_headers()
+        except Exception:
+            # No stream thread will own the connection, so give it back now
+            self.server.close_stream(self.request)
+            raise
+
+        stream = threading.Thread(target=self._stream_frames, name="http-stream")
+        stream.daemon = True
+        stream.start()
+
+    def _stream_frames(self):
+        """Push every new frame to the client until it disconnects"""
+        streamer = self.server.camera_streamer
+        streamer.tune_thread('http')
+        stream_width = streamer.config.get('stream_width') or None
+        stream_quality = streamer.config.get('stream_quality', 75)
+        last_id = 0
         try:
             while True:
-                frame = self.server.camera_streamer.get_jpeg_frame()
+                # Sleep until the camera publishes something we haven't sent
+                frame_id = streamer.wait_for_frame(last_id)
+                if frame_id == last_id:
+                    continue
+                last_id = frame_id
+
+                frame = streamer.get_jpeg_frame(stream_width, stream_quality)
                 if frame:
-                    self.send_header('Content-Type', 'image/jpeg')
-                    self.send_header('Content-Length', str(len(frame)))
-                    self.end_headers()
-                    self.wfile.write(frame)
-                    self.wfile.write(b'--frame\r\n')
-                time.sleep(0.033)  # ~30fps for viewing
+                    part_header = (b'\r\n--frame\r\n'
+                                   b'Content-Type: image/jpeg\r\n'
+                                   b'Content-Length: %d\r\n\r\n' % len(frame))
+                    self.send_buffers([part_header, frame])
         except Exception as e:
             logger.debug(f"Stream closed: {e}")
+        finally:
+            self.server.close_stream(self.request)
+
+    def send_buffers(self, buffers):
+        """Send several buffers with one gathered write (writev) per attempt"""
+        pending = [memoryview(buf) for buf in buffers]
+        while pending:
+            sent = self.connection.sendmsg(pending)
+            # Drop whatever a partial send already covered
+            while sent:
+                if sent >= len(pending[0]):
+                    sent -= len(pending.pop(0))
+                else:
+                    pending[0] = pending[0][sent:]
+                    sent = 0
 
     def send_single_frame(self):
         """Send single JPEG frame"""
@@ -259,23 +968,36 @@ class StreamingHandler(BaseHTTPRequestHandler):
         else:
             self.send_error(503, "No frame available")
 
+    def send_saved_frame(self, n):
+        """Send frame number n from the ring file"""
+        streamer = self.server.camera_streamer
+        if streamer.config.get('storage', 'files') != 'ring':
+            self.send_error(404, "Saved frames are only served with ring storage")
+            return
+        if not n.isdecimal():
+            self.send_error(400, "Frame number must be a non-negative integer")
+            return
+
+        frame = streamer.read_saved_frame(int(n))
+        if frame:
+            content_type = 'image/webp' if streamer.config.get('format', 'webp').lower() == 'webp' else 'image/jpeg'
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(frame)))
+            self.end_headers()
+            self.wfile.write(frame)
+        else:
+            self.send_error(404, f"Frame {n} is not in the ring")
+
     def send_status(self):
         """Send service status as JSON"""
-        # Count actual files
-        files = list(Path(self.server.camera_streamer.config['frame_dir']).glob(self.server.camera_streamer.get_file_pattern()))
-
-        status = {
-            'running': self.server.camera_streamer.running,
-            'frame_count': self.server.camera_streamer.frame_counter,
-            'files_on_disk': len(files),
-            'frame_dir': self.server.camera_streamer.config['frame_dir'],
-            'config': self.server.camera_streamer.config
-        }
+        body = self.server.camera_streamer.status_json()
 
         self.send_response(200)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
         self.end_headers()
-        self.wfile.write(json.dumps(status, indent=2).encode())
+        self.wfile.write(body)
 
     def log_message(self, format, *args):
         """Suppress default HTTP logging"""
@@ -283,12 +1005,67 @@ class StreamingHandler(BaseHTTPRequestHandler):
 
 
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
-    """Threaded HTTP server for handling multiple connections"""
+    """HTTP server handling connections on a fixed pool of worker threads"""
 
     def __init__(self, address, handler, camera_streamer):
         super().__init__(address, handler)
         self.camera_streamer = camera_streamer
 
+        # Accepted connections wait here for a free worker; when it fills
+        # up, new connections get a 503 instead of a new thread
+        config = camera_streamer.config
+        self._requests = queue.Queue(maxsize=config.get('http_backlog', 16))
+        # Streams run on their own threads so they never tie up a worker
+        self._stream_slots = threading.BoundedSemaphore(config.get('max_streams', 8))
+        self._detached = set()
+        for i in range(config.get('http_workers', 8)):
+            worker = threading.Thread(target=self._worker_loop, name=f"http-worker-{i}")
+            worker.daemon = True
+            worker.start()
+
+    def process_request(self, request, client_address):
+        """Queue the connection for the worker pool, reject it if saturated"""
+        try:
+            self._requests.put_nowait((request, client_address))
+        except queue.Full:
+            logger.warning(f"HTTP workers busy, rejecting {client_address[0]}")
+            try:
+                request.sendall(b'HTTP/1.0 503 Service Unavailable\r\n'
+                                b'Content-Length: 0\r\n'
+                                b'Connection: close\r\n\r\n')
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
+    def detach_stream(self, request):
+        """Claim a stream slot and keep the worker from closing the socket"""
+        if not self._stream_slots.acquire(blocking=False):
+            logger.warning("Stream limit reached, rejecting client")
+            return False
+        self._detached.add(request)
+        return True
+
+    def close_stream(self, request):
+        """Close a detached stream connection and free its slot"""
+        self._detached.discard(request)
+        super().shutdown_request(request)
+        self._stream_slots.release()
+
+    def shutdown_request(self, request):
+        """Close the connection unless a stream thread has taken it over"""
+        if request in self._detached:
+            self._detached.discard(request)
+            return
+        super().shutdown_request(request)
+
+    def _worker_loop(self):
+        """Serve queued connections forever"""
+        self.camera_streamer.tune_thread('http')
+        while True:
+            request, client_address = self._requests.get()
+            # ThreadingMixIn's per-connection body: handle, report errors, close
+            self.process_request_thread(request, client_address)
+
 
 def load_config(config_file=None):
     """Load configuration from file or use defaults"""
@@ -301,7 +1078,26 @@ def load_config(config_file=None):
         'frame_dir': '/tmp/webcam',
         'format': 'webp',
         'quality': 90,
+        'stream_width': 640,  # Width of /stream preview, 0 for full resolution
+        'stream_quality': 75,
+        'fourcc': 'MJPG',  # Camera capture format, '' for the driver default
+        'hw_encode': True,  # Use NVJPEG for JPEG encoding when available
         'http_port': 8086,
+        'http_workers': 8,
+        'http_backlog': 16,
+        'max_streams': 8,  # /stream clients are served outside the worker pool
+        'write_queue_size': 16,  # Frames waiting for the disk writer before drops
+        'write_batch_size': 8,
+        'write_batch_spins': 3,  # 1 ms waits for a batch to fill
+        'io_uring': True,  # Linux: batch writes through io_uring if liburing is installed
+        'direct_io': False,  # Linux: O_DIRECT writes, bypassing the page cache
+        'direct_io_buffer_mb': 4,
+        'storage': 'files',  # 'files' (img_NNNNNN per frame) or 'ring'
+        'ring_slots': 600,
+        'ring_slot_kb': 512,
+        'ring_path': None,  # Defaults to frames.ring in frame_dir
+        'pin_threads': False,  # Linux: dedicate a CPU core to the capture thread
+        'capture_priority': 0,  # Linux: SCHED_FIFO priority for capture, 0 = off
         'max_frames': 10000  # Not used in stable version
     }
 